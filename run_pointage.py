@@ -13,11 +13,16 @@ Usage:
 """
 
 import sys
+from collections import defaultdict
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent))
 
-from src.bots.pointage_bot import run_sync, run_daemon, test_connection, PointageBot
+# Les modules du bot sont importés dans chaque commande pour ne charger
+# que ce qui est nécessaire (démarrage plus rapide des commandes ponctuelles)
+
+# Taille des lots d'écriture de la commande fix (un appel = une transaction Odoo)
+FIX_CHUNK_SIZE = 50
 
 
 def cleanup_open_attendances(max_hours=24):
@@ -43,24 +48,41 @@ def cleanup_open_attendances(max_hours=24):
 
     cutoff = datetime.now() - timedelta(hours=max_hours)
     closed = 0
-    skipped = 0
+    errors = 0
 
-    for att in open_attendances:
-        try:
-            check_in = datetime.strptime(att['check_in'], '%Y-%m-%d %H:%M:%S')
+    # Calcul pur : (présence, check_out à +8h) pour les présences antérieures au cutoff
+    try:
+        to_close = [
+            (att, (check_in + timedelta(hours=8)).isoformat(sep=' ', timespec='seconds'))
+            for att in open_attendances
+            if (check_in := datetime.fromisoformat(att['check_in'])) < cutoff
+        ]
+    except Exception as e:
+        print(f"    Erreur: {e}")
+        return
 
-            if check_in < cutoff:
-                check_out = (check_in + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
-                odoo.update_attendance_checkout(att['id'], check_out)
-                emp_name = att['employee_id'][1] if att['employee_id'] else 'N/A'
+    skipped = len(open_attendances) - len(to_close)
+
+    # Regroupe les présences par heure de sortie calculée → un seul write par groupe
+    buckets = defaultdict(list)
+    by_id = {}
+    for att, check_out in to_close:
+        buckets[check_out].append(att['id'])
+        by_id[att['id']] = att
+
+    for check_out, ids in buckets.items():
+        failures = odoo.execute_batch('hr.attendance', 'write', ids, {'check_out': check_out})
+        for att_id in ids:
+            att = by_id[att_id]
+            emp_name = att['employee_id'][1] if att['employee_id'] else 'N/A'
+            if att_id in failures:
+                print(f"    Erreur: {emp_name} ({att['check_in']}) - {failures[att_id]}")
+                errors += 1
+            else:
                 print(f"    Fermé: {emp_name} ({att['check_in']} → {check_out})")
                 closed += 1
-            else:
-                skipped += 1
-        except Exception as e:
-            print(f"    Erreur: {e}")
 
-    print(f"\n  ✅ {closed} présences fermées, {skipped} récentes ignorées")
+    print(f"\n  ✅ {closed} présences fermées, {skipped} récentes ignorées, {errors} erreurs")
 
 
 def fix_corrupted_attendances(days_back=7):
@@ -101,51 +123,45 @@ def fix_corrupted_attendances(days_back=7):
     errors = 0
 
     # Grouper par employé pour détecter les doublons
-    by_employee = {}
+    by_employee = defaultdict(list)
     for att in corrupted:
         emp_id = att['employee_id'][0] if att.get('employee_id') else None
         if emp_id:
-            if emp_id not in by_employee:
-                by_employee[emp_id] = []
             by_employee[emp_id].append(att)
 
+    # Collecte les présences à réouvrir et les doublons à supprimer
+    reopen = []
+    delete = []
     for emp_id, emp_attendances in by_employee.items():
-        emp_name = emp_attendances[0]['employee_id'][1] if emp_attendances[0].get('employee_id') else 'N/A'
-
-        if len(emp_attendances) == 1:
-            # Une seule présence corrompue → réouvrir (supprimer check_out)
-            att = emp_attendances[0]
-            try:
-                odoo.execute('hr.attendance', 'write', [att['id']], {'check_out': False})
-                print(f"  ✅ {emp_name}: ID {att['id']} réouverte ({att['check_in']})")
-                fixed += 1
-            except Exception as e:
-                print(f"  ❌ {emp_name}: ID {att['id']} erreur - {e}")
-                errors += 1
+        # Une seule présence corrompue → réouvrir (supprimer check_out)
+        # Plusieurs → garder la première (par check_in), supprimer les autres
+        sorted_atts = sorted(emp_attendances, key=lambda x: x['check_in'])
+        reopen.append(sorted_atts[0])
+        delete.extend(sorted_atts[1:])
+
+    # Appels groupés (par lots de FIX_CHUNK_SIZE) au lieu d'un appel par présence
+    failures = odoo.execute_batch(
+        'hr.attendance', 'write', [att['id'] for att in reopen], {'check_out': False},
+        chunk_size=FIX_CHUNK_SIZE,
+    )
+    for att in reopen:
+        emp_name = att['employee_id'][1] if att.get('employee_id') else 'N/A'
+        if att['id'] in failures:
+            print(f"  ❌ {emp_name}: ID {att['id']} erreur - {failures[att['id']]}")
+            errors += 1
         else:
-            # Plusieurs présences corrompues → garder la première, supprimer les autres
-            # Trier par check_in
-            sorted_atts = sorted(emp_attendances, key=lambda x: x['check_in'])
-
-            # Réouvrir la première
-            first = sorted_atts[0]
-            try:
-                odoo.execute('hr.attendance', 'write', [first['id']], {'check_out': False})
-                print(f"  ✅ {emp_name}: ID {first['id']} réouverte ({first['check_in']})")
-                fixed += 1
-            except Exception as e:
-                print(f"  ❌ {emp_name}: ID {first['id']} erreur - {e}")
-                errors += 1
-
-            # Supprimer les autres (doublons)
-            for att in sorted_atts[1:]:
-                try:
-                    odoo.execute('hr.attendance', 'unlink', [att['id']])
-                    print(f"  🗑️  {emp_name}: ID {att['id']} supprimée (doublon)")
-                    deleted += 1
-                except Exception as e:
-                    print(f"  ❌ {emp_name}: ID {att['id']} erreur suppression - {e}")
-                    errors += 1
+            print(f"  ✅ {emp_name}: ID {att['id']} réouverte ({att['check_in']})")
+            fixed += 1
+
+    failures = odoo.execute_batch('hr.attendance', 'unlink', [att['id'] for att in delete], chunk_size=FIX_CHUNK_SIZE)
+    for att in delete:
+        emp_name = att['employee_id'][1] if att.get('employee_id') else 'N/A'
+        if att['id'] in failures:
+            print(f"  ❌ {emp_name}: ID {att['id']} erreur suppression - {failures[att['id']]}")
+            errors += 1
+        else:
+            print(f"  🗑️  {emp_name}: ID {att['id']} supprimée (doublon)")
+            deleted += 1
 
     print(f"\n  Résumé:")
     print(f"    ✅ {fixed} présences réouvertes")
@@ -155,19 +171,23 @@ def fix_corrupted_attendances(days_back=7):
 
 def main():
     if len(sys.argv) < 2:
+        from src.bots.pointage_bot import run_sync
         run_sync()
         return
 
     cmd = sys.argv[1].lower()
 
     if cmd == 'test':
+        from src.bots.pointage_bot import test_connection
         test_connection()
 
     elif cmd == 'daemon':
         interval = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        from src.bots.pointage_bot import run_daemon
         run_daemon(interval)
 
     elif cmd == 'sync':
+        from src.bots.pointage_bot import run_sync
         run_sync()
 
     elif cmd == 'cleanup':
@@ -3,17 +3,30 @@ PointageBot - Synchronisation ZK BioTime → Odoo
 Extrait les pointages de la pointeuse et les intègre dans hr.attendance
 """
 
-import json
+import bisect
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import ClassVar, Deque, List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass, asdict
+from rapidfuzz import fuzz, process
 
 from .base_bot import BaseBot
 from ..core.config import Config
+from ..core.serialization import json_dumps, json_loads
 from ..integrations.odoo import OdooClient
 from ..integrations.zkbiotime import ZKBioTimeClient, Pointage
 
+# ZK BioTime renvoie l'heure locale (UTC+1), Odoo stocke en UTC
+ZK_UTC_OFFSET = timedelta(hours=1)
+
+# Nombre d'entrées conservées dans sync_log.jsonl
+SYNC_LOG_MAX_ENTRIES = 100
+
+# Présences créées par appel Odoo lors du flush
+CREATE_BATCH_SIZE = 200
+
 
 @dataclass
 class SyncResult:
@@ -44,16 +57,36 @@ class PointageBot(BaseBot):
     ZK BioTime → Odoo hr.attendance
     """
 
+    # Contenu de employee_mapping.json, indexé par date de modification du fichier
+    _mapping_cache: ClassVar[Optional[Tuple[float, Dict]]] = None
+
     def __init__(self):
         super().__init__("PointageBot - Synchronisation Pointages")
         self.zk_client: Optional[ZKBioTimeClient] = None
         self.odoo_client: Optional[OdooClient] = None
         self.badge_mapping: Dict[str, int] = {}
         self.name_mapping: Dict[str, int] = {}
+        self._name_choices: List[str] = []
+        self._name_ids: List[int] = []
         self.stats = SyncStats()
 
+        # État en mémoire d'un sync (voir collect et _prefetch_attendances)
+        self.prefetched_opens: Optional[List[Dict]] = None
+        self.window_start: Optional[datetime] = None
+        self.attendances_by_emp: Dict[int, List[Dict]] = defaultdict(list)
+        self._open_cache: Dict[int, Optional[Dict]] = {}
+        self.pending_creates: List[Dict] = []
+        self.pending_closes: Dict[str, List[int]] = defaultdict(list)
+        self.close_results: Dict[int, Optional[SyncResult]] = {}
+        # Check-ins / check-outs connus par employé, triés (recherche par bisect)
+        self.known_times: Dict[str, Dict[int, List[datetime]]] = {
+            'check_in': defaultdict(list), 'check_out': defaultdict(list),
+        }
+
         self.data_dir = Config.DATA_DIR / "pointage"
-        self.sync_log_file = self.data_dir / "sync_log.json"
+        self.sync_log_file = self.data_dir / "sync_log.jsonl"
+        self._log_buffer: Optional[Deque[bytes]] = None
+        self._log_lines_on_disk = 0
         self.mapping_file = self.data_dir / "employee_mapping.json"
 
     def initialize(self) -> bool:
@@ -61,6 +94,14 @@ class PointageBot(BaseBot):
         Config.ensure_dirs()
         self.data_dir.mkdir(parents=True, exist_ok=True)
 
+        if self.odoo_client and self.zk_client:
+            # Instance réutilisée (mode daemon) : garde les sessions ouvertes
+            if not self.ensure_healthy():
+                return False
+            self._load_or_build_mapping()
+            print(f"  ✅ Connexions réutilisées, {len(self.badge_mapping)} employés mappés par badge")
+            return True
+
         print("  Connexion à Odoo...")
         self.odoo_client = OdooClient()
         if not self.odoo_client.connect():
@@ -80,25 +121,54 @@ class PointageBot(BaseBot):
 
         return True
 
+    def ensure_healthy(self) -> bool:
+        """Vérifie les connexions existantes et reconnecte si nécessaire"""
+        if not self.odoo_client.ping():
+            print("  ⚠️ Session Odoo perdue, reconnexion...")
+            if not self.odoo_client.connect():
+                print("  ❌ Impossible de se connecter à Odoo")
+                return False
+
+        if not self.zk_client.check_connection():
+            print("  Reconnexion à ZK BioTime...")
+            if not self.zk_client.connect():
+                print("  ❌ Impossible de se connecter à ZK BioTime")
+                return False
+
+        return True
+
     def _load_or_build_mapping(self):
         """Charge le mapping employés depuis le cache ou le reconstruit"""
         if self.mapping_file.exists():
             try:
-                with open(self.mapping_file, 'r') as f:
-                    data = json.load(f)
-                    self.badge_mapping = data.get('badge_mapping', {})
-                    self.name_mapping = data.get('name_mapping', {})
-
-                    last_update = data.get('last_update')
-                    if last_update:
-                        last_dt = datetime.fromisoformat(last_update)
-                        if datetime.now() - last_dt < timedelta(days=1):
-                            return
+                data = self._read_mapping_file()
+                self.badge_mapping = dict(data.get('badge_mapping', {}))
+                self.name_mapping = dict(data.get('name_mapping', {}))
+
+                last_update = data.get('last_update')
+                if last_update:
+                    last_dt = datetime.fromisoformat(last_update)
+                    if datetime.now() - last_dt < timedelta(days=1):
+                        self._index_names()
+                        return
             except:
                 pass
 
         self._build_mapping()
 
+    def _read_mapping_file(self) -> Dict:
+        """Lit le fichier de mapping, sans le re-parser s'il n'a pas changé depuis la dernière lecture"""
+        mtime = self.mapping_file.stat().st_mtime
+        cache = PointageBot._mapping_cache
+        if cache and cache[0] == mtime:
+            return cache[1]
+
+        with open(self.mapping_file, 'rb') as f:
+            data = json_loads(f.read())
+
+        PointageBot._mapping_cache = (mtime, data)
+        return data
+
     def _build_mapping(self):
         """Construit le mapping entre employés ZK BioTime et Odoo"""
         print("  Construction du mapping employés...")
@@ -117,17 +187,25 @@ class PointageBot(BaseBot):
             for emp in odoo_employees
             if emp.get('name')
         }
+        self._index_names()
 
         zk_employees = self.zk_client.get_employees()
         print(f"    {len(zk_employees)} employés ZK BioTime")
 
-        unmatched = []
-        for zk_emp in zk_employees:
-            badge = str(zk_emp.get('badge_number', zk_emp.get('id', '')))
-            name = zk_emp.get('name', '')
+        unmatched = [
+            zk_emp for zk_emp in zk_employees
+            if not self._find_odoo_employee(
+                str(zk_emp.get('badge_number', zk_emp.get('id', ''))), zk_emp.get('name', ''),
+            )
+        ]
+        # Index construit à l'instant depuis get_employees() : recherche locale uniquement
+        self._resolve_names([zk_emp.get('name', '') for zk_emp in unmatched], remote=False)
 
-            if badge not in self.badge_mapping and name.lower().strip() not in self.name_mapping:
-                unmatched.append(f"{name} (badge: {badge})")
+        unmatched = [
+            f"{zk_emp.get('name', '')} (badge: {zk_emp.get('badge_number', zk_emp.get('id', ''))})"
+            for zk_emp in unmatched
+            if zk_emp.get('name', '').lower().strip() not in self.name_mapping
+        ]
 
         if unmatched:
             print(f"    ⚠️ {len(unmatched)} employés ZK non trouvés dans Odoo:")
@@ -141,26 +219,39 @@ class PointageBot(BaseBot):
     def _save_mapping(self):
         """Sauvegarde le mapping dans un fichier"""
         try:
-            with open(self.mapping_file, 'w') as f:
-                json.dump({
+            with open(self.mapping_file, 'wb') as f:
+                f.write(json_dumps({
                     'badge_mapping': self.badge_mapping,
                     'name_mapping': self.name_mapping,
                     'last_update': datetime.now().isoformat(),
-                }, f, indent=2)
+                }))
         except Exception as e:
             print(f"  ⚠️ Erreur sauvegarde mapping: {e}")
 
     def collect(self, start_date: datetime = None, end_date: datetime = None, **kwargs) -> List[Pointage]:
-        """Collecte les pointages depuis ZK BioTime."""
+        """
+        Collecte les pointages depuis ZK BioTime.
+        Les présences ouvertes Odoo sont récupérées en parallèle pour analyze().
+        """
         print(f"  Récupération des pointages depuis ZK BioTime...")
 
         # Par défaut, utilise la date du dernier sync (géré par zk_client)
         # Ne force plus minuit pour éviter de retraiter les mêmes pointages
 
-        pointages = self.zk_client.get_attendances(
-            start_date=start_date,
-            end_date=end_date,
-        )
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pointages_future = executor.submit(
+                self.zk_client.get_attendances,
+                start_date=start_date,
+                end_date=end_date,
+            )
+            opens_future = executor.submit(
+                self.odoo_client.search_read,
+                'hr.attendance',
+                [('check_out', '=', False)],
+                fields=['id', 'employee_id', 'check_in', 'check_out'],
+            )
+            pointages = pointages_future.result()
+            self.prefetched_opens = opens_future.result()
 
         print(f"  ✅ {len(pointages)} pointages récupérés")
 
@@ -169,20 +260,37 @@ class PointageBot(BaseBot):
 
         return pointages
 
-    def analyze(self, pointages: List[Pointage], **kwargs) -> List[SyncResult]:
-        """Analyse et synchronise les pointages vers Odoo."""
+    def analyze(self, pointages: List[Pointage], open_attendances: List[Dict] = None, **kwargs) -> List[SyncResult]:
+        """
+        Analyse et synchronise les pointages vers Odoo.
+
+        Args:
+            pointages: Pointages triés par timestamp
+            open_attendances: Présences ouvertes déjà récupérées (défaut: celles de collect())
+        """
+        if open_attendances is None:
+            open_attendances = self.prefetched_opens
+        self.prefetched_opens = None
+        self._open_cache = {}
+
         results = []
         self.stats = SyncStats(total_pointages=len(pointages))
 
         # Groupe les pointages par employé
-        pointages_by_employee = {}
+        pointages_by_employee = defaultdict(list)
         for p in pointages:
-            if p.employee_id not in pointages_by_employee:
-                pointages_by_employee[p.employee_id] = []
             pointages_by_employee[p.employee_id].append(p)
 
         print(f"  Traitement de {len(pointages)} pointages pour {len(pointages_by_employee)} employés...")
 
+        # Recherche floue groupée des employés sans badge ni nom connu
+        self._resolve_names([
+            emp_pointages[0].employee_name
+            for emp_id, emp_pointages in pointages_by_employee.items()
+            if not self._find_odoo_employee(emp_id, emp_pointages[0].employee_name)
+        ])
+
+        to_sync = []
         for emp_id, emp_pointages in pointages_by_employee.items():
             odoo_emp_id = self._find_odoo_employee(emp_id, emp_pointages[0].employee_name)
 
@@ -199,34 +307,281 @@ class PointageBot(BaseBot):
                     ))
                 continue
 
-            # Traite les pointages triés par timestamp
-            sorted_pointages = sorted(emp_pointages, key=lambda p: p.timestamp)
+            # collect() trie déjà globalement par timestamp : le regroupement conserve l'ordre
+            assert all(a.timestamp <= b.timestamp for a, b in zip(emp_pointages, emp_pointages[1:])), \
+                "Les pointages doivent être triés par timestamp"
+            to_sync.append((odoo_emp_id, emp_pointages))
 
+        if not to_sync:
+            return results
+
+        # Pré-charge en une fois les présences des employés concernés,
+        # puis traite les pointages en mémoire et écrit tout en lot
+        earliest = min(emp_pointages[0].timestamp for _, emp_pointages in to_sync) - ZK_UTC_OFFSET
+        self._prefetch_attendances([odoo_emp_id for odoo_emp_id, _ in to_sync], earliest, open_attendances)
+
+        for odoo_emp_id, sorted_pointages in to_sync:
             for pointage in sorted_pointages:
                 result = self._process_pointage(pointage, odoo_emp_id)
                 results.append(result)
 
+        self._flush_pending()
+
         return results
 
+    def _prefetch_attendances(self, employee_ids: List[int], earliest: datetime, opens: List[Dict] = None):
+        """
+        Charge en deux requêtes les présences ouvertes et récentes des employés.
+        La requête des présences ouvertes est évitée si elles sont fournies.
+
+        La fenêtre démarre la veille du premier pointage (UTC) pour couvrir
+        les présences du jour et les check-outs proches d'un pointage.
+        """
+        self.window_start = (earliest - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.attendances_by_emp = defaultdict(list)
+        self.pending_creates = []
+        self.pending_closes = defaultdict(list)
+        self.close_results = {}
+        self.known_times = {'check_in': defaultdict(list), 'check_out': defaultdict(list)}
+
+        fields = ['id', 'employee_id', 'check_in', 'check_out']
+        if opens is None:
+            opens = self.odoo_client.search_read(
+                'hr.attendance',
+                [('employee_id', 'in', employee_ids), ('check_out', '=', False)],
+                fields=fields,
+            )
+        else:
+            wanted = set(employee_ids)
+            opens = [att for att in opens if att.get('employee_id') and att['employee_id'][0] in wanted]
+        window = self.odoo_client.load_attendance_window(
+            employee_ids, self.window_start.isoformat(sep=' ', timespec='seconds'),
+        )
+
+        # Les présences ouvertes de ces employés sont toutes connues
+        self._open_cache.update(dict.fromkeys(employee_ids))
+
+        records = {att['id']: att for att in opens}
+        records.update((att['id'], att) for atts in window.values() for att in atts)
+        for att in sorted(records.values(), key=lambda a: a['check_in']):
+            emp_id = att['employee_id'][0]
+            record = self._add_record(emp_id, att)
+            if record['check_out'] is None:
+                # Triées par check_in → la présence ouverte la plus récente l'emporte
+                self._open_cache[emp_id] = record
+
+    def _add_record(self, odoo_emp_id: int, att: Dict) -> Dict:
+        """Ajoute une présence Odoo à l'état en mémoire (triée par check_in)"""
+        record = {
+            'id': att['id'],
+            'check_in': datetime.fromisoformat(att['check_in']),
+            'check_out': datetime.fromisoformat(att['check_out']) if att.get('check_out') else None,
+            'pending': None,
+        }
+        bisect.insort(self.attendances_by_emp[odoo_emp_id], record, key=lambda r: r['check_in'])
+        self._mark_seen(odoo_emp_id, 'check_in', record['check_in'])
+        self._mark_seen(odoo_emp_id, 'check_out', record['check_out'])
+        return record
+
+    def _get_open_attendance(self, odoo_emp_id: int) -> Optional[Dict]:
+        """Présence ouverte d'un employé, mémorisée pour la durée de analyze()"""
+        if odoo_emp_id not in self._open_cache:
+            # Employé hors pré-chargement → une requête, puis mise en cache
+            att = self.odoo_client.get_open_attendance(odoo_emp_id)
+            self._open_cache[odoo_emp_id] = self._add_record(odoo_emp_id, att) if att else None
+        return self._open_cache[odoo_emp_id]
+
+    def _attendance_for_day(self, odoo_emp_id: int, day) -> Optional[Dict]:
+        """Dernière présence connue dont le check-in tombe ce jour-là"""
+        records = self.attendances_by_emp[odoo_emp_id]
+        next_day = datetime.combine(day, datetime.min.time()) + timedelta(days=1)
+        i = bisect.bisect_left(records, next_day, key=lambda r: r['check_in'])
+        if i and records[i - 1]['check_in'].date() == day:
+            return records[i - 1]
+        return None
+
+    def _attendance_near(self, odoo_emp_id: int, field: str, timestamp: datetime, tolerance_minutes: int) -> bool:
+        """Vérifie si une présence connue a son check_in/check_out à ± tolérance"""
+        times = self.known_times[field][odoo_emp_id]
+        tolerance = timedelta(minutes=tolerance_minutes)
+        i = bisect.bisect_left(times, timestamp - tolerance)
+        return i < len(times) and times[i] <= timestamp + tolerance
+
+    def _mark_seen(self, odoo_emp_id: int, field: str, timestamp: Optional[datetime]):
+        """Indexe un check_in/check_out pour _attendance_near"""
+        if timestamp:
+            bisect.insort(self.known_times[field][odoo_emp_id], timestamp)
+
+    def _next_attendance(self, odoo_emp_id: int, open_attendance: Dict) -> Optional[datetime]:
+        """Check-in de la présence suivant une présence ouverte"""
+        if open_attendance['check_in'] < self.window_start:
+            # Hors de la fenêtre pré-chargée → interroge Odoo
+            next_attendance = self.odoo_client.get_next_attendance(
+                odoo_emp_id, open_attendance['check_in'].isoformat(sep=' ', timespec='seconds'),
+            )
+            if next_attendance:
+                return datetime.fromisoformat(next_attendance['check_in'])
+            return None
+
+        for record in self.attendances_by_emp[odoo_emp_id]:
+            if record['check_in'] > open_attendance['check_in']:
+                return record['check_in']
+        return None
+
+    def _queue_checkin(self, odoo_emp_id: int, check_in: datetime, result: SyncResult):
+        """Met en attente la création d'une présence (écrite au flush)"""
+        pending = {
+            'vals': {'employee_id': odoo_emp_id, 'check_in': check_in.isoformat(sep=' ', timespec='seconds')},
+            'results': [result],
+        }
+        record = {'id': None, 'check_in': check_in, 'check_out': None, 'pending': pending}
+        self.pending_creates.append(pending)
+        bisect.insort(self.attendances_by_emp[odoo_emp_id], record, key=lambda r: r['check_in'])
+        self._mark_seen(odoo_emp_id, 'check_in', check_in)
+        self._open_cache[odoo_emp_id] = record
+
+    def _queue_checkout(self, odoo_emp_id: int, record: Dict, check_out: datetime, result: Optional[SyncResult] = None):
+        """Met en attente la fermeture d'une présence (écrite au flush)"""
+        check_out_str = check_out.isoformat(sep=' ', timespec='seconds')
+        if record['pending']:
+            # Présence créée pendant ce sync → créée directement fermée
+            record['pending']['vals']['check_out'] = check_out_str
+            if result:
+                record['pending']['results'].append(result)
+        else:
+            self.pending_closes[check_out_str].append(record['id'])
+            self.close_results[record['id']] = result
+        record['check_out'] = check_out
+        self._mark_seen(odoo_emp_id, 'check_out', check_out)
+        self._open_cache[odoo_emp_id] = None
+
+    def _flush_pending(self):
+        """Écrit en lot les fermetures puis les créations de présences en attente"""
+        # Fermetures d'abord : Odoo refuse un check-in si une présence est encore ouverte
+        for check_out, ids in self.pending_closes.items():
+            failures = self.odoo_client.execute_batch('hr.attendance', 'write', ids, {'check_out': check_out})
+            for attendance_id in ids:
+                result = self.close_results.get(attendance_id)
+                if attendance_id in failures:
+                    if result:
+                        self.stats.errors += 1
+                        result.action = 'error'
+                        result.error = 'Erreur mise à jour check-out'
+                    else:
+                        print(f"    ❌ Impossible de fermer la présence orpheline #{attendance_id}: {failures[attendance_id]}")
+                elif result:
+                    self.stats.checkouts_updated += 1
+                    print(f"    ✅ Sortie: {result.employee_name} à {result.pointage.timestamp.strftime('%H:%M:%S')}")
+                else:
+                    print(f"    ✅ Présence orpheline #{attendance_id} fermée → {check_out}")
+
+        if not self.pending_creates:
+            return
+
+        attendance_ids = self.odoo_client.create_attendance_checkins(
+            [pending['vals'] for pending in self.pending_creates],
+            chunk_size=CREATE_BATCH_SIZE,
+        )
+
+        for pending, attendance_id in zip(self.pending_creates, attendance_ids):
+            checkout_failed = False
+            if not attendance_id and 'check_out' in pending['vals']:
+                attendance_id, checkout_failed = self._retry_closed_create(pending['vals'])
+
+            for result in pending['results']:
+                if not attendance_id:
+                    self.stats.errors += 1
+                    result.action = 'error'
+                    result.error = 'Erreur création check-in'
+                    continue
+
+                if checkout_failed and result.action != 'checkin':
+                    self.stats.errors += 1
+                    result.action = 'error'
+                    result.error = 'Erreur mise à jour check-out'
+                    continue
+
+                result.attendance_id = attendance_id
+                label = 'Entrée' if result.action == 'checkin' else 'Sortie'
+                if result.action == 'checkin':
+                    self.stats.checkins_created += 1
+                else:
+                    self.stats.checkouts_updated += 1
+                print(f"    ✅ {label}: {result.employee_name} à {result.pointage.timestamp.strftime('%H:%M:%S')}")
+
+    def _retry_closed_create(self, vals: Dict) -> Tuple[Optional[int], bool]:
+        """
+        Reprise d'une présence créée directement fermée et refusée par Odoo :
+        crée le check-in seul puis écrit le check-out à part, pour conserver
+        l'entrée même si la sortie est rejetée.
+
+        Returns:
+            (ID de la présence créée ou None, True si l'écriture du check-out a échoué)
+        """
+        checkin_vals = {key: value for key, value in vals.items() if key != 'check_out'}
+        attendance_id = self.odoo_client.create_attendance_checkins([checkin_vals])[0]
+        if not attendance_id:
+            return None, False
+
+        failures = self.odoo_client.execute_batch(
+            'hr.attendance', 'write', [attendance_id], {'check_out': vals['check_out']},
+        )
+        if failures:
+            print(f"  ⚠️ Erreur mise à jour check-out (présence #{attendance_id}, check_out={vals['check_out']}): {failures[attendance_id]}")
+        return attendance_id, bool(failures)
+
     def _find_odoo_employee(self, zk_emp_id: str, zk_emp_name: str) -> Optional[int]:
-        """Trouve l'ID employé Odoo correspondant"""
+        """Trouve l'ID employé Odoo correspondant (badge puis nom)"""
         if zk_emp_id in self.badge_mapping:
             return self.badge_mapping[zk_emp_id]
 
-        name_lower = zk_emp_name.lower().strip()
-        if name_lower in self.name_mapping:
-            return self.name_mapping[name_lower]
+        return self.name_mapping.get(zk_emp_name.lower().strip())
 
-        emp = self.odoo_client.find_employee_by_name(zk_emp_name, threshold=0.85)
-        if emp:
-            self.name_mapping[name_lower] = emp['id']
-            return emp['id']
+    def _index_names(self):
+        """Pré-calcule l'index des noms normalisés pour la recherche floue locale"""
+        self._name_choices = list(self.name_mapping)
+        self._name_ids = list(self.name_mapping.values())
 
-        return None
+    def _match_name(self, name_lower: str) -> Optional[int]:
+        """Recherche floue d'un nom normalisé dans l'index (seuil 0.85)"""
+        if not self._name_choices or not name_lower:
+            return None
+
+        match = process.extractOne(name_lower, self._name_choices, scorer=fuzz.ratio, score_cutoff=85)
+        return self._name_ids[match[2]] if match else None
+
+    def _resolve_names(self, names: List[str], remote: bool = True):
+        """
+        Recherche floue des noms absents du mapping : d'abord sur l'index local,
+        puis côté Odoo pour les noms restants (une seule lecture des employés,
+        mise en cache par OdooClient, puis comparaison locale).
+
+        Args:
+            remote: False si l'index vient d'être construit depuis la même liste
+                d'employés Odoo (la recherche côté Odoo ne trouverait rien de plus)
+        """
+        names = list(dict.fromkeys(n for n in names if n and n.lower().strip() not in self.name_mapping))
+
+        # D'abord en local sur l'index des noms Odoo, sans appel réseau
+        for name in names:
+            emp_id = self._match_name(name.lower().strip())
+            if emp_id:
+                self.name_mapping[name.lower().strip()] = emp_id
+
+        # Reste : employés absents du mapping (ex. embauchés depuis le dernier build)
+        names = [n for n in names if n.lower().strip() not in self.name_mapping]
+        if not names or not remote:
+            return
+
+        for name in names:
+            emp = self.odoo_client.find_employee_by_name(name, threshold=0.85)
+            if emp:
+                self.name_mapping[name.lower().strip()] = emp['id']
 
     def _process_pointage(self, pointage: Pointage, odoo_emp_id: int) -> SyncResult:
         """
-        Traite un pointage individuel.
+        Traite un pointage individuel à partir des présences pré-chargées.
+        Les écritures sont mises en attente puis envoyées par _flush_pending.
 
         Logique :
         - Si le pointage tombe dans une présence existante → ignorer
@@ -236,43 +591,35 @@ class PointageBot(BaseBot):
         try:
             # Ajustement timezone: ZK BioTime renvoie heure locale (UTC+1)
             # Odoo attend UTC, donc on soustrait 1 heure
-            timestamp_utc = pointage.timestamp - timedelta(hours=1)
-            timestamp_str = timestamp_utc.strftime('%Y-%m-%d %H:%M:%S')
-            pointage_date = timestamp_utc.strftime('%Y-%m-%d')
+            timestamp_utc = pointage.timestamp - ZK_UTC_OFFSET
 
             # Vérifie si le pointage tombe dans une présence existante complète
-            existing_attendance = self.odoo_client.get_attendance_for_day(odoo_emp_id, pointage_date)
-            if existing_attendance and existing_attendance.get('check_out'):
+            existing_attendance = self._attendance_for_day(odoo_emp_id, timestamp_utc.date())
+            if existing_attendance and existing_attendance['check_out']:
                 # Vérifie si le pointage (UTC) est DANS la période de cette présence (UTC)
-                try:
-                    existing_checkin = datetime.strptime(existing_attendance['check_in'], '%Y-%m-%d %H:%M:%S')
-                    existing_checkout = datetime.strptime(existing_attendance['check_out'], '%Y-%m-%d %H:%M:%S')
+                existing_checkin = existing_attendance['check_in']
+                existing_checkout = existing_attendance['check_out']
 
-                    if existing_checkin <= timestamp_utc <= existing_checkout:
-                        # Le pointage tombe dans une présence déjà enregistrée → ignorer
-                        self.stats.skipped_duplicates += 1
-                        return SyncResult(
-                            pointage=pointage,
-                            employee_id_zk=pointage.employee_id,
-                            employee_id_odoo=odoo_emp_id,
-                            employee_name=pointage.employee_name,
-                            action='skipped',
-                            error=f'Pointage déjà couvert ({existing_checkin.strftime("%H:%M")}-{existing_checkout.strftime("%H:%M")})',
-                        )
-                except:
-                    pass  # En cas d'erreur de parsing, continue le traitement normal
+                if existing_checkin <= timestamp_utc <= existing_checkout:
+                    # Le pointage tombe dans une présence déjà enregistrée → ignorer
+                    self.stats.skipped_duplicates += 1
+                    return SyncResult(
+                        pointage=pointage,
+                        employee_id_zk=pointage.employee_id,
+                        employee_id_odoo=odoo_emp_id,
+                        employee_name=pointage.employee_name,
+                        action='skipped',
+                        error=f'Pointage déjà couvert ({existing_checkin.strftime("%H:%M")}-{existing_checkout.strftime("%H:%M")})',
+                    )
 
             # IMPORTANT: Vérifie s'il y a une présence ouverte
             # Cela détermine si c'est une entrée ou une sortie
-            open_attendance = self.odoo_client.get_open_attendance(odoo_emp_id)
+            open_attendance = self._get_open_attendance(odoo_emp_id)
 
             if open_attendance:
                 # Il y a une présence ouverte → c'est une SORTIE
-                open_checkin_str = open_attendance.get('check_in', '')
-                try:
-                    open_checkin = datetime.strptime(open_checkin_str, '%Y-%m-%d %H:%M:%S')
-                except:
-                    open_checkin = datetime.min
+                open_checkin = open_attendance['check_in']
+                open_checkin_str = open_checkin.isoformat(sep=' ', timespec='seconds')
 
                 # Vérifie si c'est le même pointage que le check-in (re-traitement)
                 # Compare en UTC pour cohérence (les deux sont maintenant en UTC)
@@ -289,33 +636,21 @@ class PointageBot(BaseBot):
                     )
 
                 # Vérifie si la présence ouverte est d'un jour DIFFÉRENT (présence orpheline)
-                open_checkin_date = open_checkin.date()
-                pointage_date_obj = timestamp_utc.date()
-
-                if open_checkin_date != pointage_date_obj:
+                if open_checkin.date() != timestamp_utc.date():
                     # Présence orpheline d'un autre jour - la fermer proprement
                     print(f"    ⚠️ Présence orpheline détectée: {pointage.employee_name} ({open_checkin_str})")
 
                     # Cherche s'il y a une présence après celle-ci
-                    next_attendance = self.odoo_client.get_next_attendance(odoo_emp_id, open_checkin_str)
+                    next_checkin = self._next_attendance(odoo_emp_id, open_attendance)
 
-                    if next_attendance:
+                    if next_checkin:
                         # Ferme juste avant la présence suivante
-                        next_checkin = datetime.strptime(next_attendance['check_in'], '%Y-%m-%d %H:%M:%S')
-                        checkout_time = (next_checkin - timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+                        checkout_time = next_checkin - timedelta(minutes=1)
                     else:
                         # Ferme avec +8h après le check-in (journée de travail standard)
-                        checkout_time = (open_checkin + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
+                        checkout_time = open_checkin + timedelta(hours=8)
 
-                    success = self.odoo_client.update_attendance_checkout(
-                        attendance_id=open_attendance['id'],
-                        check_out=checkout_time,
-                    )
-
-                    if success:
-                        print(f"    ✅ Présence orpheline fermée: {open_checkin_str} → {checkout_time}")
-                    else:
-                        print(f"    ❌ Impossible de fermer la présence orpheline")
+                    self._queue_checkout(odoo_emp_id, open_attendance, checkout_time)
 
                     # Maintenant traiter ce pointage comme une nouvelle ENTRÉE
                     open_attendance = None
@@ -337,7 +672,7 @@ class PointageBot(BaseBot):
                 # Si on a toujours une présence ouverte (pas orpheline), traiter comme SORTIE
                 if open_attendance:
                     # Vérifie si un check-out existe déjà à cette heure
-                    if self.odoo_client.check_checkout_exists(odoo_emp_id, timestamp_str, tolerance_minutes=2):
+                    if self._attendance_near(odoo_emp_id, 'check_out', timestamp_utc, tolerance_minutes=2):
                         self.stats.skipped_duplicates += 1
                         return SyncResult(
                             pointage=pointage,
@@ -349,74 +684,39 @@ class PointageBot(BaseBot):
                         )
 
                     # Ferme la présence avec l'heure du pointage
-                    success = self.odoo_client.update_attendance_checkout(
-                        attendance_id=open_attendance['id'],
-                        check_out=timestamp_str,
-                    )
-
-                    if success:
-                        self.stats.checkouts_updated += 1
-                        print(f"    ✅ Sortie: {pointage.employee_name} à {pointage.timestamp.strftime('%H:%M:%S')}")
-                        return SyncResult(
-                            pointage=pointage,
-                            employee_id_zk=pointage.employee_id,
-                            employee_id_odoo=odoo_emp_id,
-                            employee_name=pointage.employee_name,
-                            action='checkout',
-                            attendance_id=open_attendance['id'],
-                        )
-                    else:
-                        self.stats.errors += 1
-                        return SyncResult(
-                            pointage=pointage,
-                            employee_id_zk=pointage.employee_id,
-                            employee_id_odoo=odoo_emp_id,
-                            employee_name=pointage.employee_name,
-                            action='error',
-                            error='Erreur mise à jour check-out',
-                        )
-
-            # Pas de présence ouverte (ou présence orpheline fermée) → c'est une ENTRÉE
-            if not open_attendance:
-                # Pas de présence ouverte → c'est une ENTRÉE
-                # Vérifie si un check-in existe déjà à cette heure
-                if self.odoo_client.check_checkin_exists(odoo_emp_id, timestamp_str, tolerance_minutes=2):
-                    self.stats.skipped_duplicates += 1
-                    return SyncResult(
+                    result = SyncResult(
                         pointage=pointage,
                         employee_id_zk=pointage.employee_id,
                         employee_id_odoo=odoo_emp_id,
                         employee_name=pointage.employee_name,
-                        action='skipped',
-                        error='Doublon check-in détecté',
+                        action='checkout',
+                        attendance_id=open_attendance['id'],
                     )
+                    self._queue_checkout(odoo_emp_id, open_attendance, timestamp_utc, result)
+                    return result
 
-                attendance_id = self.odoo_client.create_attendance_checkin(
-                    employee_id=odoo_emp_id,
-                    check_in=timestamp_str,
+            # Pas de présence ouverte (ou présence orpheline fermée) → c'est une ENTRÉE
+            # Vérifie si un check-in existe déjà à cette heure
+            if self._attendance_near(odoo_emp_id, 'check_in', timestamp_utc, tolerance_minutes=2):
+                self.stats.skipped_duplicates += 1
+                return SyncResult(
+                    pointage=pointage,
+                    employee_id_zk=pointage.employee_id,
+                    employee_id_odoo=odoo_emp_id,
+                    employee_name=pointage.employee_name,
+                    action='skipped',
+                    error='Doublon check-in détecté',
                 )
 
-                if attendance_id:
-                    self.stats.checkins_created += 1
-                    print(f"    ✅ Entrée: {pointage.employee_name} à {pointage.timestamp.strftime('%H:%M:%S')}")
-                    return SyncResult(
-                        pointage=pointage,
-                        employee_id_zk=pointage.employee_id,
-                        employee_id_odoo=odoo_emp_id,
-                        employee_name=pointage.employee_name,
-                        action='checkin',
-                        attendance_id=attendance_id,
-                    )
-                else:
-                    self.stats.errors += 1
-                    return SyncResult(
-                        pointage=pointage,
-                        employee_id_zk=pointage.employee_id,
-                        employee_id_odoo=odoo_emp_id,
-                        employee_name=pointage.employee_name,
-                        action='error',
-                        error='Erreur création check-in',
-                    )
+            result = SyncResult(
+                pointage=pointage,
+                employee_id_zk=pointage.employee_id,
+                employee_id_odoo=odoo_emp_id,
+                employee_name=pointage.employee_name,
+                action='checkin',
+            )
+            self._queue_checkin(odoo_emp_id, timestamp_utc, result)
+            return result
 
         except Exception as e:
             self.stats.errors += 1
@@ -431,7 +731,12 @@ class PointageBot(BaseBot):
 
     def export(self, results: List[SyncResult], **kwargs) -> Path:
         """Exporte le log de synchronisation."""
-        self.zk_client.save_last_sync()
+        # N'avance le curseur que si ZK BioTime a réellement répondu,
+        # sinon les pointages de la période seraient perdus au prochain sync
+        if self.zk_client.last_fetch_ok:
+            self.zk_client.save_last_sync()
+        else:
+            print("  ⚠️ Aucune réponse de ZK BioTime : date du dernier sync inchangée")
 
         log_entry = {
             'timestamp': datetime.now().isoformat(),
@@ -451,24 +756,45 @@ class PointageBot(BaseBot):
             ],
         }
 
-        log_data = []
-        if self.sync_log_file.exists():
-            try:
-                with open(self.sync_log_file, 'r') as f:
-                    log_data = json.load(f)
-                    log_data = log_data[-99:]
-            except:
-                pass
-
-        log_data.append(log_entry)
-
-        with open(self.sync_log_file, 'w') as f:
-            json.dump(log_data, f, indent=2, ensure_ascii=False)
+        self._write_sync_log(json_dumps(log_entry) + b'\n')
 
         print(f"  ✅ Log sauvegardé: {self.sync_log_file}")
 
         return self.sync_log_file
 
+    def _write_sync_log(self, line: bytes):
+        """
+        Ajoute une entrée au log en gardant les SYNC_LOG_MAX_ENTRIES dernières.
+
+        Les dernières lignes sont conservées en mémoire (deque) : chaque cycle
+        ajoute une ligne en fin de fichier, et le fichier n'est réécrit depuis
+        le buffer que lorsqu'il atteint le double de la limite.
+        """
+        if self._log_buffer is None:
+            # Premier export de cette instance : amorce depuis la fin du fichier
+            lines = []
+            if self.sync_log_file.exists():
+                try:
+                    with open(self.sync_log_file, 'rb') as f:
+                        lines = f.readlines()
+                except Exception as e:
+                    print(f"  ⚠️ Erreur lecture log: {e}")
+            self._log_buffer = deque(lines, maxlen=SYNC_LOG_MAX_ENTRIES)
+            self._log_lines_on_disk = len(lines)
+
+        self._log_buffer.append(line)
+
+        if self._log_lines_on_disk < 2 * SYNC_LOG_MAX_ENTRIES:
+            with open(self.sync_log_file, 'ab') as f:
+                f.write(line)
+            self._log_lines_on_disk += 1
+        else:
+            tmp_file = self.sync_log_file.with_name(self.sync_log_file.name + '.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.writelines(self._log_buffer)
+            tmp_file.replace(self.sync_log_file)
+            self._log_lines_on_disk = len(self._log_buffer)
+
     def print_summary(self, data: Any, results: Any):
         """Affiche le résumé de synchronisation"""
         print(f"\nStatistiques:")
@@ -501,10 +827,13 @@ def run_daemon(interval_minutes: int = None):
 
     scheduler = BlockingScheduler()
 
+    # Une seule instance pour toute la durée du daemon : les sessions
+    # Odoo / ZK BioTime et le mapping sont réutilisés d'un cycle à l'autre
+    bot = PointageBot()
+
     def sync_job():
         print(f"\n[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] Lancement sync...")
         try:
-            bot = PointageBot()
             bot.run()
         except Exception as e:
             print(f"❌ Erreur sync: {e}")
@@ -1 +1,2 @@
-from .config import Config
+from .config import Config, Settings
+from .serialization import json_dumps, json_loads
@@ -3,35 +3,86 @@ Configuration centralisée - Variables d'environnement
 """
 
 import os
+from dataclasses import dataclass, fields
 from pathlib import Path
+from typing import Optional
 from dotenv import load_dotenv
 
 load_dotenv()
 
 
-class Config:
-    """Configuration centralisée du projet"""
+@dataclass(frozen=True, slots=True)
+class Settings:
+    """Instantané immuable de la configuration, lu une seule fois depuis l'environnement"""
 
     # Chemins
-    BASE_DIR = Path(__file__).parent.parent.parent
-    DATA_DIR = BASE_DIR / "data"
+    BASE_DIR: Path
+    DATA_DIR: Path
 
     # Odoo
-    ODOO_URL = os.getenv("ODOO_URL")
-    ODOO_DB = os.getenv("ODOO_DB")
-    ODOO_USER = os.getenv("ODOO_USER")
-    ODOO_API_KEY = os.getenv("ODOO_API_KEY")
+    ODOO_URL: Optional[str]
+    ODOO_DB: Optional[str]
+    ODOO_USER: Optional[str]
+    ODOO_API_KEY: Optional[str]
 
     # ZK BioTime (Pointage)
-    ZK_BIOTIME_URL = os.getenv("ZK_BIOTIME_URL")
-    ZK_BIOTIME_USERNAME = os.getenv("ZK_BIOTIME_USERNAME")
-    ZK_BIOTIME_PASSWORD = os.getenv("ZK_BIOTIME_PASSWORD")
-    ZK_DEVICE_IP = os.getenv("ZK_DEVICE_IP")
-    ZK_DEVICE_PORT = int(os.getenv("ZK_DEVICE_PORT", "4370"))
-    ZK_SYNC_INTERVAL_MINUTES = int(os.getenv("ZK_SYNC_INTERVAL_MINUTES", "10"))
+    ZK_BIOTIME_URL: Optional[str]
+    ZK_BIOTIME_USERNAME: Optional[str]
+    ZK_BIOTIME_PASSWORD: Optional[str]
+    ZK_DEVICE_IP: Optional[str]
+    ZK_DEVICE_PORT: int
+    ZK_SYNC_INTERVAL_MINUTES: int
+
+
+def _build_config() -> Settings:
+    """Lit les variables d'environnement et construit l'instantané"""
+    base_dir = Path(__file__).parent.parent.parent
+    return Settings(
+        BASE_DIR=base_dir,
+        DATA_DIR=base_dir / "data",
+        ODOO_URL=os.getenv("ODOO_URL"),
+        ODOO_DB=os.getenv("ODOO_DB"),
+        ODOO_USER=os.getenv("ODOO_USER"),
+        ODOO_API_KEY=os.getenv("ODOO_API_KEY"),
+        ZK_BIOTIME_URL=os.getenv("ZK_BIOTIME_URL"),
+        ZK_BIOTIME_USERNAME=os.getenv("ZK_BIOTIME_USERNAME"),
+        ZK_BIOTIME_PASSWORD=os.getenv("ZK_BIOTIME_PASSWORD"),
+        ZK_DEVICE_IP=os.getenv("ZK_DEVICE_IP"),
+        ZK_DEVICE_PORT=int(os.getenv("ZK_DEVICE_PORT", "4370")),
+        ZK_SYNC_INTERVAL_MINUTES=int(os.getenv("ZK_SYNC_INTERVAL_MINUTES", "10")),
+    )
+
+
+# Configuration courante (remplacée par Config.reload())
+CONFIG = _build_config()
+
+
+class Config:
+    """
+    Configuration centralisée du projet (vue compatible sur CONFIG).
+    Les attributs (ODOO_URL, DATA_DIR, ...) sont ceux de Settings, recopiés par _apply().
+    """
+
+    @classmethod
+    def _apply(cls, settings: Settings):
+        """Expose chaque champ de Settings comme attribut de classe"""
+        for field in fields(settings):
+            setattr(cls, field.name, getattr(settings, field.name))
+
+    @classmethod
+    def reload(cls) -> Settings:
+        """Relit .env et l'environnement, puis remplace CONFIG"""
+        global CONFIG
+        load_dotenv(override=True)
+        CONFIG = _build_config()
+        cls._apply(CONFIG)
+        return CONFIG
 
     @classmethod
     def ensure_dirs(cls):
         """Crée les dossiers nécessaires"""
         cls.DATA_DIR.mkdir(parents=True, exist_ok=True)
         (cls.DATA_DIR / "pointage").mkdir(parents=True, exist_ok=True)
+
+
+Config._apply(CONFIG)
@@ -0,0 +1,25 @@
+"""
+Sérialisation JSON compacte - orjson si disponible, sinon json standard
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # Repli sur json standard (plus lent)
+    orjson = None
+
+
+def json_dumps(obj: Any) -> bytes:
+    """Encode en JSON compact UTF-8 (sans indentation)"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_loads(data) -> Any:
+    """Décode du JSON (bytes ou str)"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
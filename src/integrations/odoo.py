@@ -2,23 +2,70 @@
 Intégration Odoo - Module Présences (hr.attendance)
 """
 
-import xmlrpc.client
-from typing import List, Optional, Dict, Any
-from difflib import SequenceMatcher
+from __future__ import annotations
 
-from ..core.config import Config
+import bisect
+import itertools
+import math
+import threading
+import time
+import requests
+from datetime import datetime, timedelta
+from requests.adapters import HTTPAdapter
+from typing import Any
+from functools import lru_cache
+
+from ..core import config
+
+# Connexions HTTP gardées ouvertes vers Odoo (appels parallèles du bot inclus)
+HTTP_POOL_SIZE = 10
+
+# Durée de validité du cache des employés (secondes)
+EMPLOYEES_CACHE_TTL = 300
+
+# Durée de validité du cache badge -> employé (secondes)
+BADGE_MAP_TTL = 300
+
+
+@lru_cache(maxsize=4096)
+def _parse_ts(timestamp: str) -> datetime:
+    """Convertit un horodatage texte (ISO ou format Odoo) en datetime naïf, avec mémoïsation"""
+    return datetime.fromisoformat(timestamp[:-1] if timestamp.endswith('Z') else timestamp.split('+')[0])
+
+
+# Noms normalisés triés par longueur : (longueurs, noms, employés correspondants)
+_NameIndex = tuple[list[int], list[str], list[dict]]
 
 
 class OdooClient:
-    """Client pour l'API Odoo XML-RPC"""
+    """Client pour l'API Odoo JSON-RPC"""
 
     def __init__(self):
-        self.url = Config.ODOO_URL
-        self.db = Config.ODOO_DB
-        self.username = Config.ODOO_USER
-        self.api_key = Config.ODOO_API_KEY
+        settings = config.CONFIG
+        self.url = settings.ODOO_URL
+        self.db = settings.ODOO_DB
+        self.username = settings.ODOO_USER
+        self.api_key = settings.ODOO_API_KEY
         self.uid = None
-        self.models = None
+
+        # Session HTTP persistante (keep-alive) réutilisée pour tous les appels :
+        # une seule poignée de main TCP/TLS par connexion du pool
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip'
+        self.session.headers['Connection'] = 'keep-alive'
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._request_ids = itertools.count(1)
+
+        # Cache de get_employees() par limite : {limit: (horodatage, employés, noms normalisés,
+        # index par longueur de nom)}
+        self._emp_cache: dict[int, tuple[float, list[dict], list[str], _NameIndex]] = {}
+        self._emp_lock = threading.Lock()
+
+        # Cache badge -> employé (un seul search_read pour tous les badges)
+        self._badge_map: dict[str, dict] | None = None
+        self._badge_map_ts = 0.0
 
     def connect(self) -> bool:
         """Établit la connexion à Odoo"""
@@ -27,39 +74,129 @@ class OdooClient:
             return False
 
         try:
-            common = xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/common')
-            self.uid = common.authenticate(self.db, self.username, self.api_key, {})
+            self.uid = self.json_rpc_call('common', 'authenticate', [self.db, self.username, self.api_key, {}])
 
             if not self.uid:
                 print("  ❌ Authentification Odoo échouée")
                 return False
 
-            self.models = xmlrpc.client.ServerProxy(f'{self.url}/xmlrpc/2/object')
             return True
 
         except Exception as e:
             print(f"  ❌ Erreur connexion Odoo: {e}")
             return False
 
+    def ping(self) -> bool:
+        """Vérifie que la session Odoo est toujours utilisable"""
+        try:
+            self.execute('hr.attendance', 'check_access_rights', 'read', raise_exception=False)
+            return True
+        except Exception:
+            return False
+
+    def json_rpc_call(self, service: str, method: str, args: list, endpoint: str = '/jsonrpc') -> Any:
+        """Appelle un service Odoo via JSON-RPC"""
+        payload = {
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'params': {'service': service, 'method': method, 'args': args},
+            'id': next(self._request_ids),
+        }
+
+        response = self.session.post(f"{self.url.rstrip('/')}{endpoint}", json=payload, timeout=60)
+        response.raise_for_status()
+        data = response.json()
+
+        if data.get('error'):
+            error = data['error']
+            message = (error.get('data') or {}).get('message') or error.get('message')
+            raise Exception(message)
+
+        return data.get('result')
+
     def execute(self, model: str, method: str, *args, **kwargs) -> Any:
         """Exécute une méthode sur un modèle Odoo"""
-        if not self.models or not self.uid:
+        if not self.uid:
             raise Exception("Non connecté à Odoo")
 
-        return self.models.execute_kw(
+        return self.json_rpc_call('object', 'execute_kw', [
             self.db, self.uid, self.api_key,
             model, method, list(args), kwargs
-        )
+        ])
+
+    def execute_batch(
+        self,
+        model: str,
+        method: str,
+        ids: list[int],
+        *args,
+        chunk_size: int = None,
+    ) -> dict[int, Exception]:
+        """
+        Exécute une méthode sur plusieurs enregistrements en un seul appel.
+        En cas d'échec du lot, réessaie enregistrement par enregistrement.
+
+        Args:
+            chunk_size: Découpe en lots de cette taille (un appel, donc une
+                transaction Odoo, par lot) pour limiter les verrous côté serveur
+
+        Returns:
+            Dict {id: erreur} des enregistrements en échec
+        """
+        outcomes = self._execute_chunked(model, method, ids, *args, chunk_size=chunk_size)
+        return {record_id: error for record_id, (_, error) in zip(ids, outcomes) if error}
+
+    def _execute_chunked(
+        self,
+        model: str,
+        method: str,
+        items: list,
+        *args,
+        chunk_size: int = None,
+    ) -> list[tuple[Any, Exception | None]]:
+        """
+        Appelle `method` sur une liste d'éléments (IDs ou valeurs) par lots de chunk_size,
+        un appel par lot ; un lot en échec est rejoué élément par élément.
+
+        Returns:
+            (résultat, erreur) pour chaque élément, dans l'ordre de items
+        """
+        if not items:
+            return []
+
+        if chunk_size and len(items) > chunk_size:
+            outcomes = []
+            for i in range(0, len(items), chunk_size):
+                outcomes.extend(self._execute_chunked(model, method, items[i:i + chunk_size], *args))
+            return outcomes
+
+        try:
+            result = self.execute(model, method, items, *args)
+            # create renvoie un ID par élément, write/unlink un seul booléen
+            if isinstance(result, list) and len(result) == len(items):
+                return [(value, None) for value in result]
+            return [(result, None)] * len(items)
+        except Exception as e:
+            print(f"  ⚠️ Erreur {method} groupé {model} ({len(items)} enregistrements): {e} → reprise unitaire")
+
+        outcomes = []
+        for item in items:
+            try:
+                result = self.execute(model, method, [item], *args)
+                outcomes.append((result[0] if isinstance(result, list) else result, None))
+            except Exception as e:
+                outcomes.append((None, e))
+        return outcomes
 
     def search_read(
         self,
         model: str,
-        domain: List,
-        fields: List[str] = None,
+        domain: list,
+        fields: list[str] = None,
         limit: int = None,
         offset: int = 0,
         order: str = None,
-    ) -> List[Dict]:
+    ) -> list[dict]:
         """Recherche et lit des enregistrements"""
         try:
             kwargs = {}
@@ -80,60 +217,100 @@ class OdooClient:
 
     # ========== Méthodes pour Pointage (hr.attendance) ==========
 
-    def get_employees(self, limit: int = 500) -> List[Dict]:
-        """Récupère la liste des employés depuis Odoo"""
-        try:
-            employees = self.search_read(
-                'hr.employee',
-                [('active', '=', True)],
-                fields=['id', 'name', 'barcode', 'department_id', 'work_email'],
-                limit=limit
-            )
-            return employees
-
-        except Exception as e:
-            print(f"  ⚠️ Erreur récupération employés: {e}")
-            return []
-
-    def find_employee_by_badge(self, badge: str) -> Optional[Dict]:
-        """Trouve un employé par son numéro de badge"""
-        try:
-            employees = self.search_read(
-                'hr.employee',
-                [('barcode', '=', str(badge)), ('active', '=', True)],
-                fields=['id', 'name', 'barcode', 'department_id'],
-                limit=1
+    def get_employees(self, limit: int = 500) -> list[dict]:
+        """Récupère la liste des employés depuis Odoo (mise en cache EMPLOYEES_CACHE_TTL secondes)"""
+        return self._load_employees(limit)[0]
+
+    def _load_employees(self, limit: int) -> tuple[list[dict], list[str], _NameIndex]:
+        """
+        Employés actifs, leurs noms normalisés et l'index de ces noms triés par
+        longueur (lengths, names, employees), depuis le cache s'il est encore valide
+        """
+        with self._emp_lock:
+            cached = self._emp_cache.get(limit)
+            if cached and time.monotonic() - cached[0] < EMPLOYEES_CACHE_TTL:
+                return cached[1], cached[2], cached[3]
+
+            try:
+                employees = self.search_read(
+                    'hr.employee',
+                    [('active', '=', True)],
+                    fields=['id', 'name', 'barcode', 'department_id', 'work_email'],
+                    limit=limit
+                )
+            except Exception as e:
+                print(f"  ⚠️ Erreur récupération employés: {e}")
+                return [], [], ([], [], [])
+
+            names = [(emp.get('name') or '').lower().strip() for emp in employees]
+            order = sorted(range(len(names)), key=lambda i: len(names[i]))
+            index = (
+                [len(names[i]) for i in order],
+                [names[i] for i in order],
+                [employees[i] for i in order],
             )
-            return employees[0] if employees else None
-
-        except Exception as e:
-            print(f"  ⚠️ Erreur recherche employé badge: {e}")
-            return None
-
-    def find_employee_by_name(self, name: str, threshold: float = 0.85) -> Optional[Dict]:
+            if employees:
+                self._emp_cache[limit] = (time.monotonic(), employees, names, index)
+            return employees, names, index
+
+    def invalidate_employees(self):
+        """Vide le cache des employés"""
+        with self._emp_lock:
+            self._emp_cache.clear()
+            self._badge_map = None
+
+    def find_employee_by_badge(self, badge: str) -> dict | None:
+        """Trouve un employé par son numéro de badge (via le cache badge -> employé)"""
+        return self._get_badge_map().get(str(badge))
+
+    def _get_badge_map(self) -> dict[str, dict]:
+        """Employés actifs indexés par badge, rechargés toutes les BADGE_MAP_TTL secondes"""
+        with self._emp_lock:
+            if self._badge_map is not None and time.monotonic() - self._badge_map_ts < BADGE_MAP_TTL:
+                return self._badge_map
+
+            try:
+                employees = self.search_read(
+                    'hr.employee',
+                    [('barcode', '!=', False), ('active', '=', True)],
+                    fields=['id', 'name', 'barcode', 'department_id'],
+                )
+            except Exception as e:
+                print(f"  ⚠️ Erreur recherche employé badge: {e}")
+                return {}
+
+            badge_map = {str(emp['barcode']): emp for emp in employees if emp.get('barcode')}
+            if badge_map:
+                self._badge_map = badge_map
+                self._badge_map_ts = time.monotonic()
+            return badge_map
+
+    def find_employee_by_name(self, name: str, threshold: float = 0.85) -> dict | None:
         """Trouve un employé par son nom (fuzzy matching)"""
+        # Import local : cleanup / fix utilisent OdooClient sans recherche floue
+        from rapidfuzz import fuzz, process
+
         try:
-            employees = self.get_employees(limit=500)
+            _, _, (lengths, names, employees) = self._load_employees(limit=500)
             name_lower = name.lower().strip()
 
-            best_match = None
-            best_score = 0
+            if not name_lower:
+                return None
 
-            for emp in employees:
-                emp_name = emp.get('name', '').lower().strip()
-                score = SequenceMatcher(None, name_lower, emp_name).ratio()
+            # fuzz.ratio <= 2*min(la, lb) / (la + lb) : seuls les noms de longueur comprise
+            # entre la*t/(2-t) et la*(2-t)/t peuvent atteindre le seuil t
+            name_len = len(name_lower)
+            lo = bisect.bisect_left(lengths, math.ceil(name_len * threshold / (2 - threshold) - 1e-9))
+            hi = bisect.bisect_right(lengths, math.floor(name_len * (2 - threshold) / threshold + 1e-9))
 
-                if score > best_score and score >= threshold:
-                    best_score = score
-                    best_match = emp
-
-            return best_match
+            match = process.extractOne(name_lower, names[lo:hi], scorer=fuzz.ratio, score_cutoff=threshold * 100)
+            return employees[lo + match[2]] if match else None
 
         except Exception as e:
             print(f"  ⚠️ Erreur recherche employé nom: {e}")
             return None
 
-    def get_open_attendance(self, employee_id: int) -> Optional[Dict]:
+    def get_open_attendance(self, employee_id: int) -> dict | None:
         """Récupère une présence ouverte (check-in sans check-out)"""
         try:
             attendances = self.search_read(
@@ -152,7 +329,25 @@ class OdooClient:
             print(f"  ⚠️ Erreur récupération présence ouverte: {e}")
             return None
 
-    def create_attendance_checkin(self, employee_id: int, check_in: str) -> Optional[int]:
+    def get_open_attendances_bulk(self, employee_ids: list[int]) -> dict[int, dict]:
+        """
+        Récupère en une requête la présence ouverte de plusieurs employés.
+
+        Returns:
+            Dict {employee_id: présence ouverte la plus récente}
+        """
+        attendances = self.search_read(
+            'hr.attendance',
+            [
+                ('employee_id', 'in', list(employee_ids)),
+                ('check_out', '=', False),
+            ],
+            fields=['id', 'employee_id', 'check_in', 'check_out'],
+            order='check_in desc'
+        )
+        return self._latest_by_employee(attendances)
+
+    def create_attendance_checkin(self, employee_id: int, check_in: str) -> int | None:
         """Crée une entrée de présence (check-in)"""
         try:
             if 'T' in str(check_in):
@@ -171,6 +366,27 @@ class OdooClient:
             print(f"  ⚠️ Erreur création check-in (emp={employee_id}, time={check_in}): {e}")
             return None
 
+    def create_attendance_checkins(self, vals_list: list[dict], chunk_size: int = None) -> list[int | None]:
+        """
+        Crée plusieurs présences en un seul appel (create multi-enregistrements).
+        En cas d'échec d'un lot, réessaie présence par présence.
+
+        Args:
+            vals_list: Valeurs des présences (employee_id, check_in, éventuellement check_out)
+            chunk_size: Découpe en lots de cette taille (un appel, donc une transaction Odoo, par lot)
+
+        Returns:
+            IDs créés, dans l'ordre de vals_list (None pour les présences en échec)
+        """
+        attendance_ids = []
+        outcomes = self._execute_chunked('hr.attendance', 'create', vals_list, chunk_size=chunk_size)
+        for vals, (attendance_id, error) in zip(vals_list, outcomes):
+            if error:
+                print(f"  ⚠️ Erreur création check-in (emp={vals['employee_id']}, time={vals['check_in']}): {error}")
+                attendance_id = None
+            attendance_ids.append(attendance_id)
+        return attendance_ids
+
     def update_attendance_checkout(self, attendance_id: int, check_out: str) -> bool:
         """Met à jour une présence avec l'heure de sortie"""
         attendance_info = None
@@ -201,49 +417,16 @@ class OdooClient:
 
     def check_checkin_exists(self, employee_id: int, timestamp: str, tolerance_minutes: int = 5) -> bool:
         """Vérifie si un check-in existe déjà à cette heure"""
-        try:
-            from datetime import datetime, timedelta
-
-            if isinstance(timestamp, str):
-                if 'T' in timestamp:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00').split('+')[0])
-                else:
-                    dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-            else:
-                dt = timestamp
-
-            start = (dt - timedelta(minutes=tolerance_minutes)).strftime('%Y-%m-%d %H:%M:%S')
-            end = (dt + timedelta(minutes=tolerance_minutes)).strftime('%Y-%m-%d %H:%M:%S')
-
-            attendances = self.search_read(
-                'hr.attendance',
-                [
-                    ('employee_id', '=', employee_id),
-                    ('check_in', '>=', start),
-                    ('check_in', '<=', end),
-                ],
-                fields=['id'],
-                limit=1
-            )
-
-            return len(attendances) > 0
-
-        except Exception as e:
-            print(f"  ⚠️ Erreur vérification doublon check-in: {e}")
-            return False
+        return self._check_field_exists(employee_id, timestamp, 'check_in', tolerance_minutes)
 
     def check_checkout_exists(self, employee_id: int, timestamp: str, tolerance_minutes: int = 5) -> bool:
         """Vérifie si un check-out existe déjà à cette heure"""
-        try:
-            from datetime import datetime, timedelta
+        return self._check_field_exists(employee_id, timestamp, 'check_out', tolerance_minutes)
 
-            if isinstance(timestamp, str):
-                if 'T' in timestamp:
-                    dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00').split('+')[0])
-                else:
-                    dt = datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S')
-            else:
-                dt = timestamp
+    def _check_field_exists(self, employee_id: int, timestamp: str, field: str, tolerance_minutes: int = 5) -> bool:
+        """Vérifie si une présence a son champ `field` (check_in / check_out) à ± tolerance_minutes"""
+        try:
+            dt = _parse_ts(timestamp) if isinstance(timestamp, str) else timestamp
 
             start = (dt - timedelta(minutes=tolerance_minutes)).strftime('%Y-%m-%d %H:%M:%S')
             end = (dt + timedelta(minutes=tolerance_minutes)).strftime('%Y-%m-%d %H:%M:%S')
@@ -252,8 +435,8 @@ class OdooClient:
                 'hr.attendance',
                 [
                     ('employee_id', '=', employee_id),
-                    ('check_out', '>=', start),
-                    ('check_out', '<=', end),
+                    (field, '>=', start),
+                    (field, '<=', end),
                 ],
                 fields=['id'],
                 limit=1
@@ -262,18 +445,16 @@ class OdooClient:
             return len(attendances) > 0
 
         except Exception as e:
-            print(f"  ⚠️ Erreur vérification doublon check-out: {e}")
+            print(f"  ⚠️ Erreur vérification doublon {field.replace('_', '-')}: {e}")
             return False
 
     def check_attendance_exists(self, employee_id: int, check_in: str, tolerance_minutes: int = 5) -> bool:
         """Vérifie si une présence existe déjà pour éviter les doublons (legacy)"""
         return self.check_checkin_exists(employee_id, check_in, tolerance_minutes)
 
-    def get_attendance_for_day(self, employee_id: int, date: str) -> Optional[Dict]:
+    def get_attendance_for_day(self, employee_id: int, date: str) -> dict | None:
         """Récupère la présence d'un employé pour une date donnée"""
         try:
-            from datetime import datetime
-
             if isinstance(date, str):
                 if ' ' in date:
                     date = date.split(' ')[0]
@@ -300,7 +481,39 @@ class OdooClient:
             print(f"  ⚠️ Erreur récupération présence du jour: {e}")
             return None
 
-    def get_next_attendance(self, employee_id: int, after_checkin: str) -> Optional[Dict]:
+    def get_attendances_for_day_bulk(self, employee_ids: list[int], date: str) -> dict[int, dict]:
+        """
+        Récupère en une requête la présence du jour de plusieurs employés.
+
+        Returns:
+            Dict {employee_id: dernière présence commencée ce jour-là}
+        """
+        if not isinstance(date, str):
+            date = date.strftime('%Y-%m-%d')
+        date = date.split(' ')[0]
+
+        attendances = self.search_read(
+            'hr.attendance',
+            [
+                ('employee_id', 'in', list(employee_ids)),
+                ('check_in', '>=', f"{date} 00:00:00"),
+                ('check_in', '<=', f"{date} 23:59:59"),
+            ],
+            fields=['id', 'employee_id', 'check_in', 'check_out'],
+            order='check_in desc'
+        )
+        return self._latest_by_employee(attendances)
+
+    @staticmethod
+    def _latest_by_employee(attendances: list[dict]) -> dict[int, dict]:
+        """Première présence de chaque employé (résultats triés par check_in desc)"""
+        latest = {}
+        for att in attendances:
+            if att.get('employee_id'):
+                latest.setdefault(att['employee_id'][0], att)
+        return latest
+
+    def get_next_attendance(self, employee_id: int, after_checkin: str) -> dict | None:
         """Récupère la présence suivante d'un employé après un check-in donné"""
         try:
             attendances = self.search_read(
@@ -319,11 +532,38 @@ class OdooClient:
             print(f"  ⚠️ Erreur récupération présence suivante: {e}")
             return None
 
-    def build_employee_badge_mapping(self) -> Dict[str, int]:
+    def load_attendance_window(self, employee_ids: list[int], start: str, end: str = None) -> dict[int, list[dict]]:
+        """
+        Charge en une requête les présences de plusieurs employés sur une période.
+
+        Args:
+            employee_ids: IDs employés Odoo
+            start: Début de la période (check_in >=, format Odoo)
+            end: Fin de la période (check_in <=, défaut: aucune)
+
+        Returns:
+            Dict {employee_id: présences triées par check_in}
+        """
+        domain = [
+            ('employee_id', 'in', list(employee_ids)),
+            ('check_in', '>=', start),
+        ]
+        if end:
+            domain.append(('check_in', '<=', end))
+
+        attendances = self.search_read(
+            'hr.attendance',
+            domain,
+            fields=['id', 'employee_id', 'check_in', 'check_out'],
+            order='check_in asc'
+        )
+
+        window = {}
+        for att in attendances:
+            if att.get('employee_id'):
+                window.setdefault(att['employee_id'][0], []).append(att)
+        return window
+
+    def build_employee_badge_mapping(self) -> dict[str, int]:
         """Construit un mapping badge -> employee_id"""
-        employees = self.get_employees()
-        return {
-            str(emp.get('barcode')): emp['id']
-            for emp in employees
-            if emp.get('barcode')
-        }
+        return {badge: emp['id'] for badge, emp in self._get_badge_map().items()}
@@ -5,27 +5,39 @@ Supporte:
 - Connexion directe à la pointeuse via pyzk (fallback)
 """
 
-import json
+from __future__ import annotations
+
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import List, Dict, Optional, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Any
 from dataclasses import dataclass, asdict
 from pathlib import Path
 
-from ..core.config import Config
+from ..core import config
+from ..core.serialization import json_dumps, json_loads
+
+# Pages de transactions récupérées simultanément
+PAGE_FETCH_WORKERS = 8
 
+# Durée de validité du cache des utilisateurs de la pointeuse (secondes)
+USERS_CACHE_TTL = 900
 
-@dataclass
+
+@dataclass(slots=True, frozen=True)
 class Pointage:
-    """Représente un pointage (entrée ou sortie)"""
+    """Représente un pointage (entrée ou sortie) — immuable, sans __dict__"""
     employee_id: str  # ID/Badge de l'employé
     employee_name: str
     timestamp: datetime
     punch_type: str  # 'IN' ou 'OUT'
-    device_id: Optional[str] = None
-    device_name: Optional[str] = None
+    device_id: str | None = None
+    device_name: str | None = None
 
-    def to_dict(self) -> Dict:
+    def to_dict(self) -> dict:
         return {
             **asdict(self),
             'timestamp': self.timestamp.isoformat(),
@@ -39,18 +51,44 @@ class ZKBioTimeClient:
     """
 
     def __init__(self):
-        self.biotime_url = Config.ZK_BIOTIME_URL
-        self.username = Config.ZK_BIOTIME_USERNAME
-        self.password = Config.ZK_BIOTIME_PASSWORD
-        self.device_ip = Config.ZK_DEVICE_IP
-        self.device_port = Config.ZK_DEVICE_PORT
-
+        settings = config.CONFIG
+        self.biotime_url = settings.ZK_BIOTIME_URL
+        self.username = settings.ZK_BIOTIME_USERNAME
+        self.password = settings.ZK_BIOTIME_PASSWORD
+        self.device_ip = settings.ZK_DEVICE_IP
+        self.device_port = settings.ZK_DEVICE_PORT
+
+        # Session persistante : pool dimensionné pour la pagination parallèle,
+        # GET rejoués automatiquement sur erreur serveur / coupure réseau
         self.session = requests.Session()
+        self.session.headers['Connection'] = 'keep-alive'
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=2 * PAGE_FETCH_WORKERS,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[500, 502, 503, 504],
+                allowed_methods=['GET'],
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         self.token = None
         self.connection_mode = None  # 'api' ou 'direct'
+        # Vrai si le dernier get_attendances() a obtenu une réponse de la source
+        self.last_fetch_ok = False
+
+        # Cache {user_id: nom} de la pointeuse (mode direct) : (horodatage, mapping)
+        self._users_cache: tuple[float, dict[str, str]] | None = None
 
         # Cache du dernier sync
-        self.last_sync_file = Config.DATA_DIR / "pointage" / "last_sync.json"
+        self.last_sync_file = settings.DATA_DIR / "pointage" / "last_sync.json"
+
+        # Endpoints API qui ont répondu, par usage ('auth', 'employees', 'attendances')
+        self.endpoints_file = settings.DATA_DIR / "pointage" / "endpoints.json"
+        self._endpoints: dict[str, str] = self._load_endpoints()
 
     def connect(self) -> bool:
         """
@@ -77,6 +115,26 @@ class ZKBioTimeClient:
         print("     Vérifiez ZK_BIOTIME_URL ou ZK_DEVICE_IP dans .env")
         return False
 
+    def check_connection(self) -> bool:
+        """
+        Vérifie que la connexion établie est toujours utilisable.
+        En mode API, se réauthentifie (jeton expiré ou révoqué) : un seul POST
+        vers l'endpoint d'authentification mémorisé.
+
+        Returns:
+            True si la connexion est valide, sinon connection_mode est remis à None
+        """
+        if self.connection_mode == 'api':
+            ok = self._connect_api()
+        elif self.connection_mode == 'direct':
+            ok = self._connect_direct()
+        else:
+            return False
+
+        if not ok:
+            self.connection_mode = None
+        return ok
+
     def _connect_api(self) -> bool:
         """Connexion via API REST ZK BioTime"""
         try:
@@ -88,7 +146,12 @@ class ZKBioTimeClient:
                 '/api/v1/auth/login/',
             ]
 
-            for endpoint in endpoints:
+            # Session réutilisée : l'ancien jeton (expiré/révoqué) ferait échouer
+            # l'authentification elle-même (401 côté DRF)
+            self.session.headers.pop('Authorization', None)
+            self.token = None
+
+            for endpoint in self._ordered_endpoints('auth', endpoints):
                 try:
                     url = f"{self.biotime_url.rstrip('/')}{endpoint}"
                     response = self.session.post(
@@ -98,10 +161,11 @@ class ZKBioTimeClient:
                     )
 
                     if response.status_code == 200:
-                        data = response.json()
+                        data = json_loads(response.content)
                         self.token = data.get('token') or data.get('access_token') or data.get('Token')
                         if self.token:
                             self.session.headers['Authorization'] = f'Token {self.token}'
+                            self._remember_endpoint('auth', endpoint)
                             return True
                 except:
                     continue
@@ -129,7 +193,7 @@ class ZKBioTimeClient:
             print(f"  ⚠️ Erreur connexion directe: {e}")
             return False
 
-    def get_employees(self) -> List[Dict]:
+    def get_employees(self) -> list[dict]:
         """
         Récupère la liste des employés.
 
@@ -141,7 +205,7 @@ class ZKBioTimeClient:
         else:
             return self._get_employees_direct()
 
-    def _get_employees_api(self) -> List[Dict]:
+    def _get_employees_api(self) -> list[dict]:
         """Récupère les employés via API"""
         try:
             # ZK BioTime 8.x
@@ -151,14 +215,15 @@ class ZKBioTimeClient:
                 '/iclock/api/employees/',
             ]
 
-            for endpoint in endpoints:
+            for endpoint in self._ordered_endpoints('employees', endpoints):
                 try:
                     url = f"{self.biotime_url.rstrip('/')}{endpoint}"
                     response = self.session.get(url, timeout=30)
 
                     if response.status_code == 200:
-                        data = response.json()
+                        data = json_loads(response.content)
                         employees = data if isinstance(data, list) else data.get('data', data.get('results', []))
+                        self._remember_endpoint('employees', endpoint)
 
                         return [
                             {
@@ -178,7 +243,7 @@ class ZKBioTimeClient:
             print(f"  ⚠️ Erreur récupération employés API: {e}")
             return []
 
-    def _get_employees_direct(self) -> List[Dict]:
+    def _get_employees_direct(self) -> list[dict]:
         """Récupère les employés directement depuis la pointeuse"""
         try:
             from zk import ZK
@@ -208,8 +273,8 @@ class ZKBioTimeClient:
         self,
         start_date: datetime = None,
         end_date: datetime = None,
-        employee_ids: List[str] = None,
-    ) -> List[Pointage]:
+        employee_ids: list[str] = None,
+    ) -> list[Pointage]:
         """
         Récupère les pointages.
 
@@ -228,6 +293,8 @@ class ZKBioTimeClient:
             # Charge la date du dernier sync ou 7 jours par défaut
             start_date = self._get_last_sync_date() or (end_date - timedelta(days=7))
 
+        self.last_fetch_ok = False
+
         if self.connection_mode == 'api':
             return self._get_attendances_api(start_date, end_date, employee_ids)
         else:
@@ -237,8 +304,8 @@ class ZKBioTimeClient:
         self,
         start_date: datetime,
         end_date: datetime,
-        employee_ids: List[str] = None,
-    ) -> List[Pointage]:
+        employee_ids: list[str] = None,
+    ) -> list[Pointage]:
         """Récupère les pointages via API avec pagination"""
         pointages = []
 
@@ -250,91 +317,46 @@ class ZKBioTimeClient:
                 '/att/api/attRecord/',
             ]
 
-            for endpoint in endpoints:
+            for endpoint in self._ordered_endpoints('attendances', endpoints):
                 try:
                     url = f"{self.biotime_url.rstrip('/')}{endpoint}"
-                    page = 1
                     page_size = 100  # Récupère 100 résultats par page
-                    all_records = []
-
-                    while True:
-                        params = {
-                            'start_time': start_date.strftime('%Y-%m-%d %H:%M:%S'),
-                            'end_time': end_date.strftime('%Y-%m-%d %H:%M:%S'),
-                            'page': page,
-                            'page_size': page_size,
-                        }
-
-                        response = self.session.get(url, params=params, timeout=60)
-
-                        if response.status_code != 200:
-                            break
-
-                        data = response.json()
-
-                        # Gère différents formats de réponse
-                        if isinstance(data, list):
-                            records = data
-                        else:
-                            records = data.get('data', data.get('results', []))
-
-                        if not records:
-                            break
-
-                        all_records.extend(records)
-
-                        # Vérifie s'il y a plus de pages
-                        total = data.get('count', 0) if isinstance(data, dict) else len(records)
-                        if len(all_records) >= total or len(records) < page_size:
-                            break
-
-                        page += 1
-
-                    if all_records:
-                        records = all_records
-
-                        for record in records:
-                            emp_id = str(record.get('emp_code') or record.get('employee_id') or record.get('pin'))
-
-                            # Filtre par employé si spécifié
-                            if employee_ids and emp_id not in employee_ids:
-                                continue
-
-                            # Parse la date/heure
-                            timestamp_str = record.get('punch_time') or record.get('att_time') or record.get('timestamp')
-                            try:
-                                if 'T' in str(timestamp_str):
-                                    timestamp = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-                                else:
-                                    timestamp = datetime.strptime(timestamp_str, '%Y-%m-%d %H:%M:%S')
-                            except:
-                                continue
-
-                            # Détermine le type (entrée/sortie)
-                            punch_state = record.get('punch_state') or record.get('status') or record.get('state', 0)
-
-                            # punch_state = 255 signifie auto-détection
-                            # On stocke 'AUTO' et le bot déterminera IN/OUT selon l'ordre
-                            if int(punch_state) == 255:
-                                punch_type = 'AUTO'
-                            elif int(punch_state) in [0, 4]:  # 0=Check-In, 4=OT-In
-                                punch_type = 'IN'
-                            else:  # 1=Check-Out, 2=Break-Out, 3=Break-In, 5=OT-Out
-                                punch_type = 'OUT'
-
-                            # Récupère le nom de l'employé
-                            emp_name = record.get('first_name', '') + ' ' + record.get('last_name', '')
-                            emp_name = emp_name.strip() or record.get('emp_name') or record.get('employee_name') or ''
-
-                            pointages.append(Pointage(
-                                employee_id=emp_id,
-                                employee_name=emp_name,
-                                timestamp=timestamp,
-                                punch_type=punch_type,
-                                device_id=str(record.get('terminal_sn') or record.get('terminal_id') or record.get('device_id') or ''),
-                                device_name=record.get('terminal_alias') or record.get('terminal_name') or record.get('device_name'),
-                            ))
-
+                    params = {
+                        'start_time': start_date.strftime('%Y-%m-%d %H:%M:%S'),
+                        'end_time': end_date.strftime('%Y-%m-%d %H:%M:%S'),
+                        'page_size': page_size,
+                    }
+
+                    # La première page donne le nombre total de résultats
+                    first_page = self._fetch_page(url, params, 1)
+                    if not first_page:
+                        continue
+
+                    records, data = first_page
+                    all_records = list(records)
+
+                    # Vérifie s'il y a plus de pages
+                    total = data.get('count', 0) if isinstance(data, dict) else len(records)
+                    if len(records) >= page_size and total > len(all_records):
+                        # Pages suivantes récupérées en parallèle (requêtes indépendantes)
+                        n_pages = -(-total // page_size)
+                        with ThreadPoolExecutor(max_workers=PAGE_FETCH_WORKERS) as executor:
+                            pages = executor.map(
+                                lambda page: self._fetch_page(url, params, page),
+                                range(2, n_pages + 1),
+                            )
+                            for page in pages:
+                                if not page or not page[0]:
+                                    break
+                                all_records.extend(page[0])
+
+                    # Réponse paginée valide ou endpoint déjà validé : fait foi même
+                    # sans pointage sur la période
+                    paginated = isinstance(data, dict) and 'count' in data
+                    if all_records or paginated or self._endpoints.get('attendances') == endpoint:
+                        pointages = self._parse_api_records(all_records, employee_ids)
+                        self._remember_endpoint('attendances', endpoint)
+                        self.last_fetch_ok = True
                         break  # Endpoint trouvé, on sort
 
                 except Exception as e:
@@ -346,12 +368,134 @@ class ZKBioTimeClient:
             print(f"  ⚠️ Erreur récupération pointages API: {e}")
             return []
 
+    def _ordered_endpoints(self, kind: str, endpoints: list[str]) -> list[str]:
+        """Candidats à essayer, l'endpoint mémorisé pour cet usage en premier"""
+        known = self._endpoints.get(kind)
+        if known in endpoints:
+            return [known] + [e for e in endpoints if e != known]
+        return endpoints
+
+    def _remember_endpoint(self, kind: str, endpoint: str):
+        """Mémorise l'endpoint qui a répondu et le persiste pour les prochains syncs"""
+        if self._endpoints.get(kind) == endpoint:
+            return
+
+        self._endpoints[kind] = endpoint
+        try:
+            self.endpoints_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.endpoints_file, 'wb') as f:
+                f.write(json_dumps({'url': self.biotime_url, 'endpoints': self._endpoints}))
+        except Exception as e:
+            print(f"  ⚠️ Erreur sauvegarde endpoints: {e}")
+
+    def _load_endpoints(self) -> dict[str, str]:
+        """Charge les endpoints mémorisés (ignorés si l'URL BioTime a changé)"""
+        try:
+            if self.endpoints_file.exists():
+                with open(self.endpoints_file, 'rb') as f:
+                    data = json_loads(f.read())
+                if data.get('url') == self.biotime_url:
+                    return dict(data.get('endpoints', {}))
+        except:
+            pass
+        return {}
+
+    def _fetch_page(self, url: str, params: dict, page: int) -> tuple[list[dict], Any] | None:
+        """
+        Récupère une page de transactions.
+
+        Returns:
+            (enregistrements, réponse décodée) ou None si erreur HTTP
+        """
+        response = self.session.get(url, params={**params, 'page': page}, timeout=60)
+
+        if response.status_code != 200:
+            return None
+
+        data = json_loads(response.content)
+
+        # Gère différents formats de réponse
+        if isinstance(data, list):
+            records = data
+        else:
+            records = data.get('data', data.get('results', []))
+
+        return records, data
+
+    def _parse_api_records(self, records: list[dict], employee_ids: list[str] = None) -> list[Pointage]:
+        """
+        Convertit les transactions de l'API en Pointage.
+        Le format (clés utilisées, format de date) est détecté une seule fois
+        sur le premier enregistrement, tous ceux d'un endpoint ayant le même schéma.
+        """
+        if not records:
+            return []
+
+        first = records[0]
+
+        def pick(*keys):
+            """Première clé renseignée dans le premier enregistrement"""
+            return next((k for k in keys if first.get(k) is not None), keys[0])
+
+        emp_key = pick('emp_code', 'employee_id', 'pin')
+        time_key = pick('punch_time', 'att_time', 'timestamp')
+        state_key = pick('punch_state', 'status', 'state')
+        name_key = pick('emp_name', 'employee_name')
+        device_key = pick('terminal_sn', 'terminal_id', 'device_id')
+        device_name_key = pick('terminal_alias', 'terminal_name', 'device_name')
+        split_name = 'first_name' in first or 'last_name' in first
+        wanted = set(employee_ids) if employee_ids else None
+
+        pointages = []
+        for record in records:
+            emp_id = str(record.get(emp_key))
+
+            # Filtre par employé si spécifié
+            if wanted and emp_id not in wanted:
+                continue
+
+            # Parse la date/heure : fromisoformat lit 'YYYY-MM-DD HH:MM:SS' comme
+            # 'YYYY-MM-DDTHH:MM:SS' ; un suffixe 'Z' est retiré pour rester en datetime naïf
+            try:
+                value = record.get(time_key)
+                timestamp = datetime.fromisoformat(value[:-1] if value.endswith('Z') else value)
+            except:
+                continue
+
+            # Détermine le type (entrée/sortie)
+            # punch_state = 255 signifie auto-détection
+            # On stocke 'AUTO' et le bot déterminera IN/OUT selon l'ordre
+            punch_state = int(record.get(state_key) or 0)
+            if punch_state == 255:
+                punch_type = 'AUTO'
+            elif punch_state in (0, 4):  # 0=Check-In, 4=OT-In
+                punch_type = 'IN'
+            else:  # 1=Check-Out, 2=Break-Out, 3=Break-In, 5=OT-Out
+                punch_type = 'OUT'
+
+            # Récupère le nom de l'employé
+            emp_name = ''
+            if split_name:
+                emp_name = f"{record.get('first_name') or ''} {record.get('last_name') or ''}".strip()
+            emp_name = emp_name or record.get(name_key) or ''
+
+            pointages.append(Pointage(
+                employee_id=emp_id,
+                employee_name=emp_name,
+                timestamp=timestamp,
+                punch_type=punch_type,
+                device_id=str(record.get(device_key) or ''),
+                device_name=record.get(device_name_key),
+            ))
+
+        return pointages
+
     def _get_attendances_direct(
         self,
         start_date: datetime,
         end_date: datetime,
-        employee_ids: List[str] = None,
-    ) -> List[Pointage]:
+        employee_ids: list[str] = None,
+    ) -> list[Pointage]:
         """Récupère les pointages directement depuis la pointeuse"""
         pointages = []
 
@@ -364,8 +508,9 @@ class ZKBioTimeClient:
             # Récupère tous les pointages
             attendances = conn.get_attendance()
 
-            # Récupère les noms des utilisateurs
-            users = {str(u.user_id): u.name for u in conn.get_users()}
+            # Récupère les noms des utilisateurs (cache, rafraîchi une fois si inconnu)
+            users = self._get_users_direct(conn)
+            refreshed = False
 
             for att in attendances:
                 # Filtre par date
@@ -378,6 +523,10 @@ class ZKBioTimeClient:
                 if employee_ids and emp_id not in employee_ids:
                     continue
 
+                if emp_id not in users and not refreshed:
+                    users = self._get_users_direct(conn, refresh=True)
+                    refreshed = True
+
                 # Détermine le type (entrée/sortie)
                 # Status: 0=Check-In, 1=Check-Out, 2=Break-Out, 3=Break-In, 4=OT-In, 5=OT-Out
                 punch_type = 'IN' if att.status in [0, 3, 4] else 'OUT'
@@ -391,35 +540,50 @@ class ZKBioTimeClient:
                 ))
 
             conn.disconnect()
+            self.last_fetch_ok = True
             return pointages
 
         except Exception as e:
+            self._users_cache = None
             print(f"  ⚠️ Erreur récupération pointages direct: {e}")
             return []
 
-    def _get_last_sync_date(self) -> Optional[datetime]:
+    def _get_users_direct(self, conn, refresh: bool = False) -> dict[str, str]:
+        """Mapping {user_id: nom} de la pointeuse, mis en cache USERS_CACHE_TTL secondes"""
+        if not refresh and self._users_cache:
+            fetched_at, users = self._users_cache
+            if time.monotonic() - fetched_at < USERS_CACHE_TTL:
+                return users
+
+        users = {str(u.user_id): u.name for u in conn.get_users()}
+        self._users_cache = (time.monotonic(), users)
+        return users
+
+    def _get_last_sync_date(self) -> datetime | None:
         """Récupère la date du dernier sync"""
         try:
             if self.last_sync_file.exists():
-                with open(self.last_sync_file, 'r') as f:
-                    data = json.load(f)
+                with open(self.last_sync_file, 'rb') as f:
+                    data = json_loads(f.read())
                     return datetime.fromisoformat(data['last_sync'])
         except:
             pass
         return None
 
     def save_last_sync(self, sync_date: datetime = None):
-        """Sauvegarde la date du dernier sync"""
+        """Sauvegarde la date du dernier sync (écriture atomique : fichier temporaire puis remplacement)"""
         try:
             self.last_sync_file.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.last_sync_file, 'w') as f:
-                json.dump({
+            tmp_file = self.last_sync_file.with_name(self.last_sync_file.name + '.tmp')
+            with open(tmp_file, 'wb') as f:
+                f.write(json_dumps({
                     'last_sync': (sync_date or datetime.now()).isoformat(),
-                }, f)
+                }))
+            tmp_file.replace(self.last_sync_file)
         except Exception as e:
             print(f"  ⚠️ Erreur sauvegarde last_sync: {e}")
 
-    def test_connection(self) -> Dict[str, Any]:
+    def test_connection(self) -> dict[str, Any]:
         """
         Teste la connexion et retourne des infos de diagnostic.
 